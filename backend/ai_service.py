@@ -1,7 +1,12 @@
 from emergentintegrations.llm.chat import LlmChat, UserMessage
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
 
+import litellm
+
+from semantic_cache import SemanticCache
+from usage_ledger import api_key_fingerprint
+
 logger = logging.getLogger(__name__)
 
 CYBERSECURITY_SYSTEM_MESSAGE = """You are a highly knowledgeable cybersecurity expert and ethical hacking instructor. Your purpose is to educate users about:
@@ -42,6 +47,65 @@ PROVIDER_MODELS = {
     "google": ["gemini-pro", "gemini-1.5-pro", "gemini-1.5-flash", "gemini-2.0-flash"]
 }
 
+# litellm model prefixes used by the prompt-prefix caching path
+LITELLM_PROVIDER_PREFIXES = {
+    "openai": "openai",
+    "anthropic": "anthropic",
+    "google": "gemini"
+}
+
+# Providers that need explicit cache breakpoints; the others cache stable
+# prefixes automatically as long as the prefix bytes do not change. Providers
+# only cache prefixes of at least ~1024 tokens (2048 for Claude Haiku), so the
+# ~300-token system prompt alone is never cached; the benefit comes once the
+# conversation history pushes the prefix past that floor.
+CACHE_CONTROL_PROVIDERS = {"anthropic"}
+
+def _cacheable_block(text: str) -> List[Dict]:
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+def build_prefix_cached_messages(messages: List[Dict[str, str]], provider: str) -> List[Dict]:
+    """Build the provider message list with the system prompt and history as a stable prefix."""
+    mark = provider in CACHE_CONTROL_PROVIDERS
+
+    prompt = [{
+        "role": "system",
+        "content": _cacheable_block(CYBERSECURITY_SYSTEM_MESSAGE) if mark else CYBERSECURITY_SYSTEM_MESSAGE
+    }]
+    # Only role and content are sent so timestamps never perturb the prefix
+    prompt.extend(
+        {"role": m["role"], "content": m.get("content", "")}
+        for m in messages
+        if m.get("role") in ("user", "assistant")
+    )
+
+    # Second breakpoint on the last non-empty turn before the new message caches
+    # the history; Anthropic rejects an empty text block carrying cache_control
+    if mark:
+        for turn in reversed(prompt[1:-1]):
+            if turn["content"]:
+                turn["content"] = _cacheable_block(turn["content"])
+                break
+    return prompt
+
+def extract_usage(response) -> Dict[str, int]:
+    """Normalize token usage, including cached prompt tokens, from a litellm response."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (
+        getattr(details, "cached_tokens", None)
+        or getattr(usage, "cache_read_input_tokens", None)
+        or 0
+    )
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": cached_tokens,
+        "cache_creation_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0
+    }
+
 def detect_api_key_provider(api_key: str) -> str:
     """Detect the provider from API key format."""
     if not api_key:
@@ -76,34 +140,64 @@ class AIService:
         api_key: str,
         provider: str,
         model: str,
-        session_id: str = "default"
+        session_id: str = "default",
+        cache: Optional[SemanticCache] = None,
+        prompt_cache: bool = False
     ) -> Dict:
         """Send chat completion request using user's API key."""
         try:
-            # Initialize chat with user's API key
-            chat = LlmChat(
-                api_key=api_key,
-                session_id=session_id,
-                system_message=CYBERSECURITY_SYSTEM_MESSAGE
-            )
-            
-            # Set model and provider
-            chat.with_model(provider, model)
-            
             # Get the last user message
             last_message = messages[-1] if messages else {"content": ""}
-            user_message = UserMessage(text=last_message.get("content", ""))
-            
-            # Send message and get response
-            response = await chat.send_message(user_message)
+            prompt = last_message.get("content", "")
+
+            # Only conversation openers are cached; follow-ups depend on prior turns
+            # Partitioned per key so one user's paid answers never reach another key
+            cacheable = cache is not None and len(messages) == 1
+            if cacheable:
+                key_id = api_key_fingerprint(api_key)
+                cached = cache.lookup(prompt, key_id, provider, model)
+                if cached is not None:
+                    return {
+                        "success": True,
+                        "message": cached,
+                        "provider": provider,
+                        "model": model,
+                        "cached": True
+                    }
+
+            usage = None
+            if prompt_cache:
+                response, usage = await AIService._prefix_cached_completion(
+                    messages, api_key, provider, model
+                )
+            else:
+                # Initialize chat with user's API key
+                chat = LlmChat(
+                    api_key=api_key,
+                    session_id=session_id,
+                    system_message=CYBERSECURITY_SYSTEM_MESSAGE
+                )
+                
+                # Set model and provider
+                chat.with_model(provider, model)
+                
+                user_message = UserMessage(text=prompt)
+                
+                # Send message and get response
+                response = await chat.send_message(user_message)
             
             logger.info(f"Successfully got response from {provider}/{model}")
+
+            if cacheable and response:
+                cache.store(prompt, key_id, provider, model, response)
             
             return {
                 "success": True,
                 "message": response,
                 "provider": provider,
-                "model": model
+                "model": model,
+                "cached": False,
+                "usage": usage
             }
             
         except Exception as e:
@@ -114,6 +208,34 @@ class AIService:
                 "message": f"Failed to get response: {str(e)}"
             }
     
+    @staticmethod
+    async def _prefix_cached_completion(
+        messages: List[Dict[str, str]],
+        api_key: str,
+        provider: str,
+        model: str
+    ) -> Tuple[str, Dict[str, int]]:
+        """Send the full conversation with a cache-friendly prefix via litellm."""
+        prefix = LITELLM_PROVIDER_PREFIXES.get(provider, provider)
+        response = await litellm.acompletion(
+            model=f"{prefix}/{model}",
+            messages=build_prefix_cached_messages(messages, provider),
+            api_key=api_key
+        )
+        usage = extract_usage(response)
+        if usage.get("cached_tokens"):
+            logger.info(f"Prompt cache hit for {provider}/{model}: {usage['cached_tokens']} tokens")
+        choice = response.choices[0]
+        # Tool-call or content-filtered finishes carry no text
+        if not choice.message.content:
+            raise ValueError(f"Empty response from {provider}/{model} (finish_reason={choice.finish_reason})")
+        return choice.message.content, usage
+
+    @staticmethod
+    async def close_clients() -> None:
+        """Release pooled provider HTTP clients."""
+        await litellm.close_litellm_async_clients()
+
     @staticmethod
     async def validate_api_key(api_key: str, provider: str) -> Dict:
         """Validate an API key by making a test request."""
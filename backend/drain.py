@@ -0,0 +1,144 @@
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+import asyncio
+import inspect
+import logging
+
+import uvicorn
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+class DrainCoordinator:
+    """Tracks in-flight requests and runs the ordered shutdown sequence.
+
+    Under DrainingServer the drain starts from the exit signal, while the
+    listening socket is still open, so new requests can be refused with a 503
+    and in-flight ones given a grace period. Under any other runner it runs
+    from the lifespan shutdown instead, before buffers are flushed.
+    """
+
+    def __init__(self, grace_period: float = 30.0):
+        self.grace_period = grace_period
+        self.draining = False
+        self.drained = False
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @asynccontextmanager
+    async def track(self):
+        self._in_flight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.set()
+
+    def begin_drain(self) -> None:
+        """Stop admitting guarded requests."""
+        self.draining = True
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Wait for in-flight requests to finish; False if the timeout expired."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def drain(self) -> bool:
+        """Refuse new requests and wait up to the grace period for in-flight ones."""
+        self.begin_drain()
+        logger.info(f"Draining {self._in_flight} in-flight requests (grace period {self.grace_period}s)")
+        idle = await self.wait_idle(self.grace_period)
+        if not idle:
+            logger.warning(f"Grace period expired with {self._in_flight} requests still in flight")
+        self.drained = True
+        return idle
+
+    async def shutdown(
+        self,
+        flush: Iterable[Callable[[], Awaitable]] = (),
+        close: Iterable[Callable] = ()
+    ) -> None:
+        """Drain if the exit signal did not, then flush buffered writes and close clients."""
+        if not self.drained:
+            await self.drain()
+        for step in list(flush) + list(close):
+            try:
+                result = step()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Shutdown step {getattr(step, '__qualname__', step)} failed: {str(e)}")
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that drains guarded requests before closing its sockets.
+
+    Plain uvicorn only runs the lifespan shutdown after it has closed the
+    listening sockets and waited for open connections, which is too late to
+    refuse new requests or bound the wait. Here the first exit signal starts
+    the drain instead; uvicorn's own shutdown begins once it finishes or the
+    grace period expires, and a repeated signal falls through unchanged.
+    """
+
+    def __init__(self, config: uvicorn.Config, coordinator: DrainCoordinator):
+        super().__init__(config)
+        self.coordinator = coordinator
+        self._drain_task: Optional[asyncio.Task] = None
+
+    def handle_exit(self, sig, frame) -> None:
+        if self.coordinator.draining or self.should_exit:
+            super().handle_exit(sig, frame)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            super().handle_exit(sig, frame)
+            return
+
+        self.coordinator.begin_drain()
+        # Keep a reference so the task is not garbage collected mid-drain
+        self._drain_task = loop.create_task(self._drain_then_exit(sig, frame))
+
+    async def _drain_then_exit(self, sig, frame) -> None:
+        if not await self.coordinator.drain() and self.config.timeout_graceful_shutdown is None:
+            # Don't let uvicorn wait forever on requests past the grace period
+            self.config.timeout_graceful_shutdown = 1
+        super().handle_exit(sig, frame)
+
+
+class DrainMiddleware:
+    """ASGI middleware that counts guarded requests and rejects new ones with 503 while draining."""
+
+    def __init__(self, app, coordinator: DrainCoordinator, path_prefixes: Tuple[str, ...]):
+        self.app = app
+        self.coordinator = coordinator
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        if self.coordinator.draining:
+            response = JSONResponse(
+                {"detail": "Server is shutting down, please retry"},
+                status_code=503,
+                headers={"Retry-After": "5"}
+            )
+            await response(scope, receive, send)
+            return
+
+        # The app call returns only once the full (possibly streamed) body is sent
+        async with self.coordinator.track():
+            await self.app(scope, receive, send)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class Message(BaseModel):
@@ -20,6 +20,26 @@ class ChatCompletionResponse(BaseModel):
     error: Optional[str] = None
     provider: Optional[str] = None
     model: Optional[str] = None
+    cached: Optional[bool] = None
+    usage: Optional[Dict[str, int]] = None
+
+class CacheStatsResponse(BaseModel):
+    enabled: bool
+    threshold: Optional[float] = None
+    max_entries: Optional[int] = None
+    entries: int = 0
+    partitions: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    hit_rate: float = 0.0
+    avg_lookup_ms: float = 0.0
+
+class UsageLedgerStatsResponse(BaseModel):
+    buffered: int = 0
+    pending: int = 0
+    capacity: int = 0
+    dropped: int = 0
 
 class DetectKeyRequest(BaseModel):
     api_key: str
@@ -44,3 +64,57 @@ class Conversation(BaseModel):
     messages: List[Message]
     created_at: str
     updated_at: str
+    user_id: Optional[str] = None
+
+class ConversationCreateRequest(BaseModel):
+    # Random per-browser identifier; there is deliberately no shared default
+    user_id: str = Field(..., min_length=16)
+    id: Optional[str] = None
+    title: str = "New Chat"
+    messages: List[Message] = []
+
+class SearchResult(BaseModel):
+    conversation_id: str
+    conversation_title: Optional[str] = None
+    message_id: str
+    role: str
+    timestamp: Optional[str] = None
+    score: float
+    highlight: str
+
+class SearchResponse(BaseModel):
+    query: str
+    total: int
+    page: int
+    page_size: int
+    backend: str
+    results: List[SearchResult]
+
+
+class UsageQueryRequest(BaseModel):
+    api_key: Optional[str] = None
+    key_id: Optional[str] = None
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+class UsageRollup(BaseModel):
+    key_id: str
+    provider: str
+    model: str
+    minute: datetime
+    requests: int = 0
+    successes: int = 0
+    cache_hits: int = 0
+    usage_reported: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    latency_ms_total: float = 0.0
+    latency_ms_max: float = 0.0
+
+class UsageQueryResponse(BaseModel):
+    key_id: str
+    rollups: List[UsageRollup]
+    totals: Dict[str, float]
@@ -0,0 +1,195 @@
+from collections import OrderedDict, defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import heapq
+import html
+import math
+import re
+
+# Keeps identifiers such as "CVE-2021-44228" or "log4j" together while also
+# indexing their parts so partial queries still match.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase search terms."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+def highlight(text: str, query: str, context: int = 80) -> str:
+    """Return an HTML-escaped snippet of text with query terms wrapped in <mark>."""
+    terms = sorted(set(tokenize(query)), key=len, reverse=True)
+    if not terms:
+        return html.escape(text[:context * 2])
+
+    pattern = re.compile(
+        r"(?<![a-z0-9])(" + "|".join(re.escape(t) for t in terms) + r")(?![a-z0-9])",
+        re.IGNORECASE
+    )
+    first = pattern.search(text)
+    start = max(0, first.start() - context) if first else 0
+    end = min(len(text), (first.end() if first else 0) + context)
+    snippet = text[start:end]
+
+    parts = []
+    last = 0
+    for match in pattern.finditer(snippet):
+        parts.append(html.escape(snippet[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group(0))}</mark>")
+        last = match.end()
+    parts.append(html.escape(snippet[last:]))
+
+    prefix = "..." if start > 0 else ""
+    suffix = "..." if end < len(text) else ""
+    return prefix + "".join(parts) + suffix
+
+
+class _UserIndex:
+    """Inverted index over one user's messages."""
+
+    def __init__(self):
+        # term -> {message_id: term frequency}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.lengths: Dict[str, int] = {}
+        self.documents: Dict[str, Dict] = {}
+        self.total_length = 0
+
+    def add(self, message: Dict) -> None:
+        message_id = message["id"]
+        if message_id in self.documents:
+            return
+        terms = tokenize(message.get("content", ""))
+        counts: Dict[str, int] = defaultdict(int)
+        for term in terms:
+            counts[term] += 1
+        for term, count in counts.items():
+            self.postings[term][message_id] = count
+        self.lengths[message_id] = len(terms)
+        self.total_length += len(terms)
+        self.documents[message_id] = message
+
+    def remove_conversation(self, conversation_id: str) -> None:
+        doomed = [
+            message_id for message_id, message in self.documents.items()
+            if message.get("conversation_id") == conversation_id
+        ]
+        for message_id in doomed:
+            message = self.documents.pop(message_id)
+            for term in set(tokenize(message.get("content", ""))):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(message_id, None)
+                    if not posting:
+                        del self.postings[term]
+            self.total_length -= self.lengths.pop(message_id)
+
+    def search(self, query: str, limit: int) -> Tuple[int, List[Tuple[float, Dict]]]:
+        """Rank messages with BM25 and return the total match count and top hits."""
+        terms = set(tokenize(query))
+        if not terms or not self.documents:
+            return 0, []
+
+        doc_count = len(self.documents)
+        avg_length = self.total_length / doc_count if doc_count else 0.0
+        scores: Dict[str, float] = defaultdict(float)
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for message_id, tf in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[message_id] / avg_length)
+                scores[message_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return len(scores), [(score, self.documents[message_id]) for message_id, score in top]
+
+
+class ConversationSearchIndex:
+    """In-process inverted index used when Mongo text search is unavailable.
+
+    Users' indexes are kept in LRU order and the least recently searched one
+    is dropped once max_users are loaded; it is rebuilt on its next search.
+    """
+
+    def __init__(self, max_users: int = 128):
+        self.max_users = max_users
+        self._users: "OrderedDict[str, _UserIndex]" = OrderedDict()
+        # Indexes being built: messages appended meanwhile are added to them too
+        self._loading: Dict[str, _UserIndex] = {}
+
+    def is_loaded(self, user_id: str) -> bool:
+        return user_id in self._users
+
+    def _install(self, user_id: str, index: _UserIndex) -> None:
+        self._users[user_id] = index
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def load(self, user_id: str, messages: List[Dict]) -> None:
+        """Build a user's index from their stored messages."""
+        index = _UserIndex()
+        for message in messages:
+            index.add(message)
+        self._install(user_id, index)
+
+    async def ensure_loaded(
+        self,
+        user_id: str,
+        fetch: Callable[[], Awaitable[List[Dict]]]
+    ) -> None:
+        """Load a user's index from fetch() unless it is already loaded.
+
+        The index is registered before fetch() runs, so messages appended
+        while it is awaiting are indexed even if the query missed them;
+        duplicates are ignored by id.
+        """
+        if user_id in self._users:
+            return
+        index = self._loading.setdefault(user_id, _UserIndex())
+        try:
+            messages = await fetch()
+            for message in messages:
+                index.add(message)
+            self._install(user_id, index)
+        finally:
+            if self._loading.get(user_id) is index:
+                del self._loading[user_id]
+
+    def add_message(self, message: Dict) -> None:
+        """Index a newly appended message if its user's index is loaded or loading."""
+        user_id = message["user_id"]
+        for index in (self._users.get(user_id), self._loading.get(user_id)):
+            if index is not None:
+                index.add(message)
+
+    def remove_conversation(self, user_id: str, conversation_id: str) -> None:
+        index = self._users.get(user_id)
+        if index is not None:
+            index.remove_conversation(conversation_id)
+
+    def search(
+        self,
+        user_id: str,
+        query: str,
+        page: int,
+        page_size: int
+    ) -> Tuple[int, List[Tuple[float, Dict]]]:
+        """Return the total match count and the requested page of ranked hits."""
+        index: Optional[_UserIndex] = self._users.get(user_id)
+        if index is None:
+            return 0, []
+        self._users.move_to_end(user_id)
+        offset = (page - 1) * page_size
+        total, hits = index.search(query, offset + page_size)
+        return total, hits[offset:]
@@ -0,0 +1,254 @@
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import logging
+import re
+import time
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Question framing words that carry no topic information, so that
+# "what is XSS" and "explain XSS" embed to the same vector. Interrogatives
+# and modals ("how", "why", "can", "should") change the question and are kept.
+STOP_WORDS = frozenset({
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "to", "in",
+    "on", "for", "and", "or", "what", "whats", "you", "me", "please",
+    "explain", "describe", "tell", "about", "define", "i", "my", "it",
+    "this", "that", "with"
+})
+
+# Words that must match exactly even when variant spellings are allowed
+QUESTION_WORDS = frozenset({
+    "how", "why", "when", "where", "which", "who", "whom", "whose", "can",
+    "could", "should", "would", "will", "shall", "may", "might", "must",
+    "do", "does", "did", "not", "no", "never"
+})
+
+# Shorter words and anything with a digit (ports, versions, CVE ids) never
+# count as spelling variants of each other
+MIN_VARIANT_LENGTH = 5
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _hash_features(features: List[str]) -> np.ndarray:
+    """Hash string features to unsigned 32-bit ints (stable across processes)."""
+    return np.fromiter(
+        (zlib.crc32(f.encode("utf-8")) for f in features),
+        dtype=np.uint32,
+        count=len(features)
+    )
+
+
+def prompt_terms(text: str) -> FrozenSet[str]:
+    """Topic-bearing words of a prompt, with framing words removed."""
+    return frozenset(w for w in TOKEN_PATTERN.findall(text.lower()) if w not in STOP_WORDS)
+
+
+def _trigrams(word: str) -> FrozenSet[str]:
+    padded = f"#{word}#"
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def word_similarity(first: str, second: str) -> float:
+    """Cosine similarity of two words' character trigram sets."""
+    a, b = _trigrams(first), _trigrams(second)
+    return len(a & b) / ((len(a) * len(b)) ** 0.5)
+
+
+def _is_variable(word: str) -> bool:
+    return (
+        len(word) >= MIN_VARIANT_LENGTH
+        and word.isalpha()
+        and word not in QUESTION_WORDS
+    )
+
+
+def terms_match(cached: FrozenSet[str], prompt: FrozenSet[str], threshold: float) -> bool:
+    """Whether two prompts have the same topic words, up to spelling variants.
+
+    Each word present in only one prompt must pair off with a distinct word
+    of the other whose trigram similarity reaches the threshold, so
+    "injection" can match "injections" at a low enough threshold while
+    "exploit" never matches "prevent", nor "TCP" "UDP".
+    """
+    if cached == prompt:
+        return True
+    unmatched = sorted(prompt - cached)
+    remaining = set(cached - prompt)
+    if len(unmatched) != len(remaining):
+        return False
+    for word in unmatched:
+        if not _is_variable(word):
+            return False
+        partner = max(
+            (w for w in remaining if _is_variable(w)),
+            key=lambda w: word_similarity(word, w),
+            default=None
+        )
+        if partner is None or word_similarity(word, partner) < threshold:
+            return False
+        remaining.discard(partner)
+    return True
+
+
+def embed_text(text: str, dim: int = 1024) -> np.ndarray:
+    """Embed text as an L2-normalized signed hashed bag of word and char n-grams."""
+    words = [w for w in TOKEN_PATTERN.findall(text.lower()) if w not in STOP_WORDS]
+    features = list(words)
+    features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+
+    vector = np.zeros(dim, dtype=np.float32)
+    if not features:
+        return vector
+
+    hashes = _hash_features(features)
+    buckets = (hashes % dim).astype(np.intp)
+    signs = np.where((hashes >> 31) & 1, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, buckets, signs)
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class _Partition:
+    """Similarity index for a single API key, provider and model, grown up to capacity."""
+
+    INITIAL_SLOTS = 16
+
+    def __init__(self, capacity: int, dim: int):
+        self.capacity = capacity
+        slots = min(capacity, self.INITIAL_SLOTS)
+        self.vectors = np.zeros((slots, dim), dtype=np.float32)
+        self.occupied = np.zeros(slots, dtype=bool)
+        # slot -> (prompt terms, cached response), least to most recently used
+        self.entries: "OrderedDict[int, Tuple[FrozenSet[str], str]]" = OrderedDict()
+
+    def candidates(self, vector: np.ndarray, threshold: float) -> List[Tuple[int, float]]:
+        """Return every slot at or above the cosine threshold, best first."""
+        if not self.entries:
+            return []
+        scores = self.vectors @ vector
+        slots = np.flatnonzero(self.occupied & (scores >= threshold))
+        slots = slots[np.argsort(-scores[slots])]
+        return [(int(slot), float(scores[slot])) for slot in slots]
+
+    def insert(self, vector: np.ndarray, terms: FrozenSet[str], response: str) -> Optional[int]:
+        """Store a response, evicting the least recently used entry when full."""
+        evicted = None
+        free = np.flatnonzero(~self.occupied)
+        if free.size:
+            slot = int(free[0])
+        elif len(self.occupied) < self.capacity:
+            slot = len(self.occupied)
+            grown = min(self.capacity, slot * 2)
+            self.vectors = np.vstack([
+                self.vectors,
+                np.zeros((grown - slot, self.vectors.shape[1]), dtype=np.float32)
+            ])
+            self.occupied = np.concatenate([self.occupied, np.zeros(grown - slot, dtype=bool)])
+        else:
+            slot, _ = self.entries.popitem(last=False)
+            evicted = slot
+        self.vectors[slot] = vector
+        self.occupied[slot] = True
+        self.entries[slot] = (terms, response)
+        return evicted
+
+
+class SemanticCache:
+    """In-memory near-duplicate prompt cache partitioned by API key, provider and model.
+
+    The threshold applies twice: cached prompts must reach it by cosine
+    similarity, and any topic word that differs must be a spelling variant
+    whose trigram similarity reaches it too (see terms_match). A single
+    changed word ("exploit" vs "prevent", "TCP" vs "UDP", one CVE id vs
+    another) barely moves the cosine score of a long prompt but changes the
+    right answer, so it never hits.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        max_entries: int = 512,
+        max_partitions: int = 256,
+        dim: int = 1024
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_partitions = max_partitions
+        self.dim = dim
+        # Partitions are themselves kept in LRU order so idle keys age out
+        self._partitions: "OrderedDict[Tuple[str, str, str], _Partition]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lookup_seconds = 0.0
+
+    def _partition(self, key_id: str, provider: str, model: str) -> _Partition:
+        key = (key_id, provider, model)
+        partition = self._partitions.get(key)
+        if partition is None:
+            if len(self._partitions) >= self.max_partitions:
+                _, evicted = self._partitions.popitem(last=False)
+                self._evictions += len(evicted.entries)
+            partition = _Partition(self.max_entries, self.dim)
+            self._partitions[key] = partition
+        self._partitions.move_to_end(key)
+        return partition
+
+    def lookup(self, prompt: str, key_id: str, provider: str, model: str) -> Optional[str]:
+        """Return the response cached under this key for a near-identical prompt, if any."""
+        started = time.perf_counter()
+        response = None
+        score = 0.0
+        partition = self._partitions.get((key_id, provider, model))
+        if partition is not None:
+            terms = prompt_terms(prompt)
+            for slot, score in partition.candidates(embed_text(prompt, self.dim), self.threshold):
+                cached_terms, cached_response = partition.entries[slot]
+                if terms_match(cached_terms, terms, self.threshold):
+                    partition.entries.move_to_end(slot)
+                    self._partitions.move_to_end((key_id, provider, model))
+                    response = cached_response
+                    break
+        self._lookup_seconds += time.perf_counter() - started
+
+        if response is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+            logger.info(f"Semantic cache hit for {provider}/{model} (score={score:.3f})")
+        return response
+
+    def store(self, prompt: str, key_id: str, provider: str, model: str, response: str) -> None:
+        """Cache a response for a prompt under the key that paid for it."""
+        vector = embed_text(prompt, self.dim)
+        if not vector.any():
+            return
+        partition = self._partition(key_id, provider, model)
+        if partition.insert(vector, prompt_terms(prompt), response) is not None:
+            self._evictions += 1
+
+    def stats(self) -> Dict:
+        """Return hit rate, lookup latency and occupancy figures."""
+        lookups = self._hits + self._misses
+        return {
+            "enabled": True,
+            "threshold": self.threshold,
+            "max_entries": self.max_entries,
+            "entries": sum(len(p.entries) for p in self._partitions.values()),
+            "partitions": len(self._partitions),
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "avg_lookup_ms": (self._lookup_seconds / lookups) * 1000 if lookups else 0.0
+        }
@@ -0,0 +1,26 @@
+"""Run the backend with a graceful drain on SIGTERM and Ctrl+C.
+
+`uvicorn server:app` still works, but it only drains once its sockets are
+closed; this entrypoint starts the drain while new requests can still be
+answered with a 503.
+"""
+import argparse
+
+import uvicorn
+
+from drain import DrainingServer
+from server import app, drain_coordinator
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the CyberAI backend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    config = uvicorn.Config(app, host=args.host, port=args.port)
+    DrainingServer(config, drain_coordinator).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,30 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List
+import time
 import uuid
 from datetime import datetime
 
 from models import (
     ChatCompletionRequest,
     ChatCompletionResponse,
+    CacheStatsResponse,
+    Conversation,
+    ConversationCreateRequest,
+    Message,
+    SearchResponse,
+    SearchResult,
+    UsageQueryRequest,
+    UsageQueryResponse,
+    UsageRollup,
+    UsageLedgerStatsResponse,
     DetectKeyRequest,
     DetectKeyResponse,
     ValidateKeyRequest,
@@ -23,6 +35,10 @@ from ai_service import (
     detect_api_key_provider,
     get_available_models
 )
+from semantic_cache import SemanticCache
+from search_index import ConversationSearchIndex, highlight
+from usage_ledger import UsageLedger, api_key_fingerprint
+from drain import DrainCoordinator, DrainMiddleware
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -32,6 +48,38 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Optional near-duplicate prompt cache in front of chat completions
+semantic_cache = None
+if os.environ.get('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true':
+    semantic_cache = SemanticCache(
+        threshold=float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.9')),
+        max_entries=int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', '512')),
+        max_partitions=int(os.environ.get('SEMANTIC_CACHE_MAX_KEYS', '256'))
+    )
+
+# Send the fixed system prompt and history as a cacheable prefix
+prompt_cache_enabled = os.environ.get('PROMPT_CACHE_ENABLED', 'false').lower() == 'true'
+
+# Conversation search uses the Mongo text index unless SEARCH_BACKEND=memory;
+# the in-process index also serves as a fallback when text search fails
+search_backend = os.environ.get('SEARCH_BACKEND', 'mongo').lower()
+search_index = ConversationSearchIndex(
+    max_users=int(os.environ.get('SEARCH_INDEX_MAX_USERS', '128'))
+)
+
+# Per-key usage records are buffered and written to Mongo off the request path
+usage_ledger = UsageLedger(
+    db,
+    max_buffer=int(os.environ.get('USAGE_BUFFER_SIZE', '10000')),
+    batch_size=int(os.environ.get('USAGE_BATCH_SIZE', '500')),
+    flush_interval=float(os.environ.get('USAGE_FLUSH_INTERVAL', '5'))
+)
+
+# Coordinates the graceful drain of chat requests on shutdown
+drain_coordinator = DrainCoordinator(
+    grace_period=float(os.environ.get('SHUTDOWN_GRACE_PERIOD', '30'))
+)
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -128,12 +176,25 @@ async def chat_completion(request: ChatCompletionRequest):
         messages = [msg.dict() for msg in request.messages]
         
         # Call AI service
+        started = time.perf_counter()
         result = await AIService.chat_completion(
             messages=messages,
             api_key=request.api_key,
             provider=request.provider,
             model=request.model,
-            session_id=request.session_id
+            session_id=request.session_id,
+            cache=semantic_cache,
+            prompt_cache=prompt_cache_enabled
+        )
+
+        usage_ledger.record(
+            api_key=request.api_key,
+            provider=request.provider,
+            model=request.model,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            success=result.get("success", False),
+            usage=result.get("usage"),
+            cached=result.get("cached", False)
         )
         
         return ChatCompletionResponse(**result)
@@ -148,9 +209,210 @@ async def chat_completion(request: ChatCompletionRequest):
             message=f"An error occurred: {str(e)}"
         )
 
+# Conversation storage and search
+def _message_document(message: Message, conversation_id: str, user_id: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "conversation_id": conversation_id,
+        "user_id": user_id,
+        "role": message.role,
+        "content": message.content,
+        "timestamp": message.timestamp or datetime.utcnow().isoformat()
+    }
+
+# Conversations are scoped to a random per-browser user_id (min 16 chars)
+# with no shared default; every lookup filters on it
+async def _load_conversation(conversation_id: str, user_id: str) -> dict:
+    conversation = await db.conversations.find_one(
+        {"user_id": user_id, "id": conversation_id}, {"_id": 0}
+    )
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation
+
+@api_router.post("/conversations", response_model=Conversation)
+async def create_conversation(request: ConversationCreateRequest):
+    """Persist a new conversation with any initial messages."""
+    if request.id and await db.conversations.find_one(
+        {"user_id": request.user_id, "id": request.id}
+    ):
+        raise HTTPException(status_code=409, detail="Conversation already exists")
+
+    now = datetime.utcnow().isoformat()
+    conversation = {
+        "id": request.id or str(uuid.uuid4()),
+        "user_id": request.user_id,
+        "title": request.title,
+        "created_at": now,
+        "updated_at": now
+    }
+    await db.conversations.insert_one(dict(conversation))
+
+    messages = [_message_document(m, conversation["id"], request.user_id) for m in request.messages]
+    if messages:
+        await db.messages.insert_many([dict(m) for m in messages])
+        for message in messages:
+            search_index.add_message(message)
+
+    return Conversation(**conversation, messages=[Message(**m) for m in messages])
+
+@api_router.get("/conversations", response_model=List[Conversation])
+async def list_conversations(user_id: str = Query(..., min_length=16)):
+    """List a user's conversations, most recently updated first."""
+    conversations = await db.conversations.find(
+        {"user_id": user_id}, {"_id": 0}
+    ).sort("updated_at", -1).to_list(1000)
+    return [Conversation(**c, messages=[]) for c in conversations]
+
+@api_router.get("/conversations/search", response_model=SearchResponse)
+async def search_conversations(
+    q: str = Query(..., min_length=1),
+    user_id: str = Query(..., min_length=16),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100)
+):
+    """Full-text search over a user's stored messages."""
+    hits = None
+    backend = "mongo"
+    if search_backend != "memory":
+        try:
+            text_filter = {"user_id": user_id, "$text": {"$search": q}}
+            total = await db.messages.count_documents(text_filter)
+            documents = await db.messages.find(
+                text_filter, {"_id": 0, "score": {"$meta": "textScore"}}
+            ).sort([("score", {"$meta": "textScore"})]).skip(
+                (page - 1) * page_size
+            ).limit(page_size).to_list(page_size)
+            hits = [(d.pop("score"), d) for d in documents]
+        except OperationFailure as e:
+            logger.warning(f"Mongo text search failed, using in-process index: {str(e)}")
+
+    if hits is None:
+        backend = "memory"
+        await search_index.ensure_loaded(
+            user_id,
+            lambda: db.messages.find({"user_id": user_id}, {"_id": 0}).to_list(None)
+        )
+        total, hits = search_index.search(user_id, q, page, page_size)
+
+    conversation_ids = list({d["conversation_id"] for _, d in hits})
+    titles = {
+        c["id"]: c["title"]
+        async for c in db.conversations.find(
+            {"user_id": user_id, "id": {"$in": conversation_ids}}, {"_id": 0, "id": 1, "title": 1}
+        )
+    }
+
+    return SearchResponse(
+        query=q,
+        total=total,
+        page=page,
+        page_size=page_size,
+        backend=backend,
+        results=[
+            SearchResult(
+                conversation_id=d["conversation_id"],
+                conversation_title=titles.get(d["conversation_id"]),
+                message_id=d["id"],
+                role=d["role"],
+                timestamp=d.get("timestamp"),
+                score=score,
+                highlight=highlight(d["content"], q)
+            )
+            for score, d in hits
+        ]
+    )
+
+@api_router.get("/conversations/{conversation_id}", response_model=Conversation)
+async def get_conversation(conversation_id: str, user_id: str = Query(..., min_length=16)):
+    """Fetch a conversation with its messages in order."""
+    conversation = await _load_conversation(conversation_id, user_id)
+    messages = await db.messages.find(
+        {"user_id": user_id, "conversation_id": conversation_id}, {"_id": 0}
+    ).sort("timestamp", 1).to_list(None)
+    return Conversation(**conversation, messages=[Message(**m) for m in messages])
+
+@api_router.post("/conversations/{conversation_id}/messages", response_model=Message)
+async def append_message(conversation_id: str, message: Message, user_id: str = Query(..., min_length=16)):
+    """Append a message to a conversation and index it for search."""
+    await _load_conversation(conversation_id, user_id)
+    document = _message_document(message, conversation_id, user_id)
+    await db.messages.insert_one(dict(document))
+    await db.conversations.update_one(
+        {"user_id": user_id, "id": conversation_id},
+        {"$set": {"updated_at": datetime.utcnow().isoformat()}}
+    )
+    search_index.add_message(document)
+    return Message(**document)
+
+@api_router.delete("/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str, user_id: str = Query(..., min_length=16)):
+    """Delete a conversation and its messages."""
+    await _load_conversation(conversation_id, user_id)
+    await db.messages.delete_many({"user_id": user_id, "conversation_id": conversation_id})
+    await db.conversations.delete_one({"user_id": user_id, "id": conversation_id})
+    search_index.remove_conversation(user_id, conversation_id)
+    return {"deleted": True}
+
+@api_router.get("/cache/stats", response_model=CacheStatsResponse)
+async def cache_stats():
+    """Report semantic cache hit rate and lookup latency."""
+    if semantic_cache is None:
+        return CacheStatsResponse(enabled=False)
+    return CacheStatsResponse(**semantic_cache.stats())
+
+@api_router.get("/usage/stats", response_model=UsageLedgerStatsResponse)
+async def usage_stats():
+    """Report usage buffer occupancy and records dropped on overflow."""
+    return UsageLedgerStatsResponse(**usage_ledger.stats())
+
+@api_router.post("/usage/query", response_model=UsageQueryResponse)
+async def query_usage(request: UsageQueryRequest):
+    """Return per-minute usage rollups for one API key."""
+    if request.api_key:
+        key_id = api_key_fingerprint(request.api_key)
+    elif request.key_id:
+        key_id = request.key_id
+    else:
+        raise HTTPException(status_code=400, detail="api_key or key_id is required")
+
+    query = {"key_id": key_id}
+    if request.provider:
+        query["provider"] = request.provider
+    if request.model:
+        query["model"] = request.model
+    if request.start or request.end:
+        query["minute"] = {}
+        if request.start:
+            query["minute"]["$gte"] = request.start
+        if request.end:
+            query["minute"]["$lt"] = request.end
+
+    rollups = await db.usage_rollups.find(
+        query, {"_id": 0, "batches": 0}
+    ).sort("minute", 1).to_list(10000)
+
+    totals = {}
+    for field in ("requests", "successes", "cache_hits", "usage_reported", "prompt_tokens",
+                  "completion_tokens", "cached_tokens", "latency_ms_total"):
+        totals[field] = sum(r.get(field, 0) for r in rollups)
+
+    return UsageQueryResponse(
+        key_id=key_id,
+        rollups=[UsageRollup(**r) for r in rollups],
+        totals=totals
+    )
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Added before CORS so 503 responses during a drain still carry CORS headers
+app.add_middleware(
+    DrainMiddleware,
+    coordinator=drain_coordinator,
+    path_prefixes=("/api/chat/",)
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -159,6 +421,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        # Compound text index: every search filters on user_id first
+        await db.messages.create_index([("user_id", 1), ("content", "text")])
+        await db.messages.create_index([("user_id", 1), ("conversation_id", 1), ("timestamp", 1)])
+        await db.conversations.create_index([("user_id", 1), ("updated_at", -1)])
+        await db.conversations.create_index([("user_id", 1), ("id", 1)], unique=True)
+        # Unique rollup key: duplicate-key errors are how replayed batches are detected
+        await db.usage_rollups.create_index(
+            [("key_id", 1), ("minute", 1), ("provider", 1), ("model", 1)], unique=True
+        )
+    except Exception as e:
+        logger.warning(f"Could not create indexes: {str(e)}")
+
+@app.on_event("startup")
+async def start_usage_ledger():
+    usage_ledger.start()
+
 @app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+async def graceful_shutdown():
+    # Drain chat requests (already done on the exit signal under serve.py),
+    # flush buffered usage records, and only then close provider clients and Mongo
+    await drain_coordinator.shutdown(
+        flush=[usage_ledger.stop],
+        close=[AIService.close_clients, client.close]
+    )
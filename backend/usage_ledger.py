@@ -0,0 +1,216 @@
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import uuid
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def api_key_fingerprint(api_key: str) -> str:
+    """Stable identifier for an API key that never stores the key itself."""
+    return hashlib.sha256(api_key.strip().encode("utf-8")).hexdigest()[:16]
+
+
+class UsageLedger:
+    """Write-behind usage log: records are buffered in memory and flushed in batches.
+
+    Flushes are idempotent so a retried batch is never counted twice: each
+    record carries its own _id (re-inserts are ignored as duplicates) and each
+    batch has an id that rollup documents remember once applied.
+    """
+
+    def __init__(
+        self,
+        db,
+        max_buffer: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 5.0
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Bounded ring buffer: when full the oldest record is overwritten
+        self._buffer: Deque[Dict] = deque(maxlen=max_buffer)
+        # Batch that failed to flush, retried as-is before new records are taken
+        self._pending: Optional[Dict] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self.dropped = 0
+
+    def record(
+        self,
+        api_key: str,
+        provider: str,
+        model: str,
+        latency_ms: float,
+        success: bool,
+        usage: Optional[Dict[str, int]] = None,
+        cached: bool = False
+    ) -> None:
+        """Queue a completion record; never blocks the request path."""
+        usage = usage or {}
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+            # Logged on the first loss and then every 1000, not once per record
+            if self.dropped % 1000 == 1:
+                logger.warning(
+                    f"Usage buffer full ({self._buffer.maxlen} records), "
+                    f"dropped {self.dropped} oldest records so far"
+                )
+        self._buffer.append({
+            "_id": uuid.uuid4().hex,
+            "key_id": api_key_fingerprint(api_key),
+            "provider": provider,
+            "model": model,
+            "timestamp": datetime.utcnow(),
+            "latency_ms": latency_ms,
+            "success": success,
+            "cached": cached,
+            # The default LlmChat path does not expose token usage
+            "usage_reported": bool(usage),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0)
+        })
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and drain everything still buffered."""
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self._buffer or self._pending:
+            if not await self.flush():
+                break
+        unflushed = len(self._buffer) + (len(self._pending["records"]) if self._pending else 0)
+        if unflushed:
+            logger.error(f"Discarding {unflushed} usage records that could not be flushed")
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while (self._buffer or self._pending) and not self._stopping:
+                if not await self.flush():
+                    break
+
+    async def flush(self) -> bool:
+        """Write one batch of records and their per-minute rollups to Mongo."""
+        async with self._flush_lock:
+            if self._pending is None:
+                batch: List[Dict] = []
+                while self._buffer and len(batch) < self.batch_size:
+                    batch.append(self._buffer.popleft())
+                if not batch:
+                    return True
+                self._pending = {"id": uuid.uuid4().hex, "records": batch, "inserted": False}
+
+            pending = self._pending
+            try:
+                if not pending["inserted"]:
+                    await self._insert_records(pending["records"])
+                    pending["inserted"] = True
+                await self._apply_rollups(pending["id"], pending["records"])
+            except Exception as e:
+                logger.error(f"Failed to flush {len(pending['records'])} usage records: {str(e)}")
+                return False
+
+            self._pending = None
+            return True
+
+    async def _insert_records(self, records: List[Dict]) -> None:
+        try:
+            await self.db.usage_records.insert_many([dict(r) for r in records], ordered=False)
+        except BulkWriteError as e:
+            # Records written by an earlier, partially failed attempt are fine
+            details = e.details or {}
+            if details.get("writeConcernErrors") or any(
+                err.get("code") != DUPLICATE_KEY_ERROR for err in details.get("writeErrors", [])
+            ):
+                raise
+
+    async def _apply_rollups(self, batch_id: str, records: List[Dict]) -> None:
+        updates = self._rollup_updates(batch_id, records)
+        try:
+            await self.db.usage_rollups.bulk_write(
+                [UpdateOne(f, u, upsert=True) for f, u in updates], ordered=False
+            )
+        except BulkWriteError as e:
+            details = e.details or {}
+            errors = details.get("writeErrors", [])
+            if details.get("writeConcernErrors") or any(
+                err.get("code") != DUPLICATE_KEY_ERROR for err in errors
+            ):
+                raise
+            # A duplicate key means the rollup document exists: either this batch
+            # was already applied, or another writer created it first. Retrying
+            # without upsert applies the increment only in the second case.
+            retries = [UpdateOne(*updates[err["index"]]) for err in errors]
+            await self.db.usage_rollups.bulk_write(retries, ordered=False)
+
+    @staticmethod
+    def _rollup_updates(batch_id: str, batch: List[Dict]) -> List[Tuple[Dict, Dict]]:
+        """Aggregate a batch into (filter, update) pairs, one per key/provider/model/minute."""
+        rollups: Dict[tuple, Dict] = defaultdict(lambda: defaultdict(int))
+        peaks: Dict[tuple, float] = defaultdict(float)
+        for r in batch:
+            minute = r["timestamp"].replace(second=0, microsecond=0)
+            key = (r["key_id"], r["provider"], r["model"], minute)
+            totals = rollups[key]
+            totals["requests"] += 1
+            totals["successes"] += 1 if r["success"] else 0
+            totals["cache_hits"] += 1 if r["cached"] else 0
+            totals["usage_reported"] += 1 if r["usage_reported"] else 0
+            totals["prompt_tokens"] += r["prompt_tokens"]
+            totals["completion_tokens"] += r["completion_tokens"]
+            totals["cached_tokens"] += r["cached_tokens"]
+            totals["latency_ms_total"] += r["latency_ms"]
+            peaks[key] = max(peaks[key], r["latency_ms"])
+
+        # The batches guard makes replaying a batch a no-op
+        return [
+            (
+                {
+                    "key_id": key_id,
+                    "provider": provider,
+                    "model": model,
+                    "minute": minute,
+                    "batches": {"$ne": batch_id}
+                },
+                {
+                    "$inc": dict(totals),
+                    "$max": {"latency_ms_max": peaks[(key_id, provider, model, minute)]},
+                    "$push": {"batches": batch_id}
+                }
+            )
+            for (key_id, provider, model, minute), totals in rollups.items()
+        ]
+
+    def stats(self) -> Dict:
+        """Return buffer occupancy and how many records were lost to overflow."""
+        return {
+            "buffered": len(self._buffer),
+            "pending": len(self._pending["records"]) if self._pending else 0,
+            "capacity": self._buffer.maxlen,
+            "dropped": self.dropped
+        }
@@ -18,7 +18,9 @@ import {
   Bot,
   User,
   Moon,
-  Sun
+  Sun,
+  Search,
+  X
 } from 'lucide-react';
 import { useToast } from '../hooks/use-toast';
 import { getModelsForProvider } from '../mock';
@@ -47,6 +49,8 @@ const ChatInterface = ({
   const [message, setMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [sidebarOpen, setSidebarOpen] = useState(true);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
   const messagesEndRef = useRef(null);
 
   const scrollToBottom = () => {
@@ -80,6 +84,7 @@ const ChatInterface = ({
 
   const deleteConversation = (id) => {
     setConversations(conversations.filter(c => c.id !== id));
+    apiService.deleteConversation(id);
     if (activeConversation === id) {
       setActiveConversation(null);
     }
@@ -139,8 +144,10 @@ const ChatInterface = ({
     setMessage('');
     setIsLoading(true);
 
+    const currentConv = updatedConversations.find(c => c.id === activeConversation);
+    apiService.syncMessage(currentConv, userMessage);
+
     try {
-      const currentConv = updatedConversations.find(c => c.id === activeConversation);
       const messages = currentConv.messages.map(msg => ({
         role: msg.role,
         content: msg.content,
@@ -175,6 +182,10 @@ const ChatInterface = ({
         });
 
         setConversations(finalConversations);
+        apiService.syncMessage(
+          finalConversations.find(c => c.id === activeConversation),
+          assistantMessage
+        );
         
         toast({
           title: 'Response received',
@@ -200,6 +211,29 @@ const ChatInterface = ({
     }
   };
 
+  const runSearch = async () => {
+    const query = searchQuery.trim();
+    if (!query) {
+      setSearchResults(null);
+      return;
+    }
+    try {
+      const response = await apiService.searchConversations(query);
+      setSearchResults(response.results);
+    } catch (error) {
+      toast({
+        title: 'Search failed',
+        description: error.message || 'Could not search conversations',
+        variant: 'destructive'
+      });
+    }
+  };
+
+  const clearSearch = () => {
+    setSearchQuery('');
+    setSearchResults(null);
+  };
+
   const handleKeyPress = (e) => {
     if (e.key === 'Enter' && !e.shiftKey) {
       e.preventDefault();
@@ -291,48 +325,95 @@ const ChatInterface = ({
             </div>
           )}
 
+          {/* Conversation Search */}
+          <div className="flex items-center gap-2">
+            <Input
+              value={searchQuery}
+              onChange={(e) => setSearchQuery(e.target.value)}
+              onKeyDown={(e) => e.key === 'Enter' && runSearch()}
+              placeholder="Search conversations..."
+              className={darkMode ? 'bg-black/40 border-cyan-500/30 text-cyan-100' : 'bg-white/60 border-cyan-200'}
+            />
+            <Button
+              size="sm"
+              variant="ghost"
+              onClick={searchResults ? clearSearch : runSearch}
+              className={darkMode ? 'hover:bg-cyan-500/10' : 'hover:bg-cyan-100/50'}
+            >
+              {searchResults ? <X className="w-4 h-4" /> : <Search className="w-4 h-4" />}
+            </Button>
+          </div>
+
           {/* Conversations List */}
-          <ScrollArea className="h-[calc(100vh-250px)]">
-            <div className="space-y-2">
-              {conversations.map(conv => (
-                <Card
-                  key={conv.id}
-                  className={`p-3 cursor-pointer transition-all duration-200 hover:shadow-md group ${
-                    activeConversation === conv.id
-                      ? darkMode
-                        ? 'bg-cyan-950/50 border-cyan-500/50 shadow-md shadow-cyan-500/20'
-                        : 'bg-gradient-to-r from-cyan-50 to-green-50 border-cyan-300 shadow-md'
-                      : darkMode
+          <ScrollArea className="h-[calc(100vh-300px)]">
+            {searchResults ? (
+              <div className="space-y-2">
+                {searchResults.length === 0 && (
+                  <p className={`text-sm ${darkMode ? 'text-gray-400' : 'text-gray-500'}`}>No matches found.</p>
+                )}
+                {searchResults.map(result => (
+                  <Card
+                    key={result.message_id}
+                    className={`p-3 cursor-pointer transition-all duration-200 hover:shadow-md ${
+                      darkMode
                         ? 'bg-black/40 border-cyan-500/20 hover:bg-black/60'
                         : 'bg-white/60 border-gray-200 hover:bg-white/80'
-                  }`}
-                  onClick={() => setActiveConversation(conv.id)}
-                >
-                  <div className="flex items-start justify-between">
-                    <div className="flex-1 min-w-0">
-                      <div className="flex items-center gap-2 mb-1">
-                        <MessageSquare className={`w-4 h-4 flex-shrink-0 ${darkMode ? 'text-cyan-400' : 'text-cyan-600'}`} />
-                        <h3 className={`text-sm font-medium truncate ${darkMode ? 'text-cyan-100' : 'text-gray-800'}`}>{conv.title}</h3>
+                    }`}
+                    onClick={() => setActiveConversation(result.conversation_id)}
+                  >
+                    <h3 className={`text-sm font-medium truncate ${darkMode ? 'text-cyan-100' : 'text-gray-800'}`}>
+                      {result.conversation_title || 'Conversation'}
+                    </h3>
+                    {/* Snippet is HTML-escaped by the backend; only <mark> tags are added */}
+                    <p
+                      className={`text-xs mt-1 ${darkMode ? 'text-gray-400' : 'text-gray-500'}`}
+                      dangerouslySetInnerHTML={{ __html: result.highlight }}
+                    />
+                  </Card>
+                ))}
+              </div>
+            ) : (
+              <div className="space-y-2">
+                {conversations.map(conv => (
+                  <Card
+                    key={conv.id}
+                    className={`p-3 cursor-pointer transition-all duration-200 hover:shadow-md group ${
+                      activeConversation === conv.id
+                        ? darkMode
+                          ? 'bg-cyan-950/50 border-cyan-500/50 shadow-md shadow-cyan-500/20'
+                          : 'bg-gradient-to-r from-cyan-50 to-green-50 border-cyan-300 shadow-md'
+                        : darkMode
+                          ? 'bg-black/40 border-cyan-500/20 hover:bg-black/60'
+                          : 'bg-white/60 border-gray-200 hover:bg-white/80'
+                    }`}
+                    onClick={() => setActiveConversation(conv.id)}
+                  >
+                    <div className="flex items-start justify-between">
+                      <div className="flex-1 min-w-0">
+                        <div className="flex items-center gap-2 mb-1">
+                          <MessageSquare className={`w-4 h-4 flex-shrink-0 ${darkMode ? 'text-cyan-400' : 'text-cyan-600'}`} />
+                          <h3 className={`text-sm font-medium truncate ${darkMode ? 'text-cyan-100' : 'text-gray-800'}`}>{conv.title}</h3>
+                        </div>
+                        <p className={`text-xs ${darkMode ? 'text-gray-400' : 'text-gray-500'}`}>
+                          {new Date(conv.updatedAt).toLocaleDateString()}
+                        </p>
                       </div>
-                      <p className={`text-xs ${darkMode ? 'text-gray-400' : 'text-gray-500'}`}>
-                        {new Date(conv.updatedAt).toLocaleDateString()}
-                      </p>
+                      <Button
+                        size="sm"
+                        variant="ghost"
+                        className="opacity-0 group-hover:opacity-100 transition-opacity"
+                        onClick={(e) => {
+                          e.stopPropagation();
+                          deleteConversation(conv.id);
+                        }}
+                      >
+                        <Trash2 className="w-4 h-4 text-red-500" />
+                      </Button>
                     </div>
-                    <Button
-                      size="sm"
-                      variant="ghost"
-                      className="opacity-0 group-hover:opacity-100 transition-opacity"
-                      onClick={(e) => {
-                        e.stopPropagation();
-                        deleteConversation(conv.id);
-                      }}
-                    >
-                      <Trash2 className="w-4 h-4 text-red-500" />
-                    </Button>
-                  </div>
-                </Card>
-              ))}
-            </div>
+                  </Card>
+                ))}
+              </div>
+            )}
           </ScrollArea>
         </div>
       </div>
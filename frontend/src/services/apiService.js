@@ -28,6 +28,25 @@ axiosInstance.interceptors.response.use(
   }
 );
 
+// Random per-browser identifier that scopes conversations stored on the backend
+const getUserId = () => {
+  let userId = localStorage.getItem('userId');
+  if (!userId) {
+    userId = window.crypto.randomUUID();
+    localStorage.setItem('userId', userId);
+  }
+  return userId;
+};
+
+// Per-conversation promise chains keep mirrored messages in order
+const pendingSync = {};
+
+const toStoredMessage = (msg) => ({
+  role: msg.role,
+  content: msg.content,
+  timestamp: msg.timestamp
+});
+
 export const apiService = {
   // Detect API key provider and get available models
   detectApiKey: async (apiKey) => {
@@ -75,5 +94,63 @@ export const apiService = {
       }
       throw error;
     }
+  },
+
+  // Mirror a new message to backend storage so it becomes searchable.
+  // Conversations not stored yet (new or from before syncing) are created
+  // with their full history on the first 404.
+  syncMessage: (conversation, message) => {
+    const userId = getUserId();
+    const previous = pendingSync[conversation.id] || Promise.resolve();
+    pendingSync[conversation.id] = previous.then(async () => {
+      try {
+        await axiosInstance.post(
+          `/conversations/${encodeURIComponent(conversation.id)}/messages`,
+          toStoredMessage(message),
+          { params: { user_id: userId } }
+        );
+      } catch (error) {
+        if (error.response?.status !== 404) {
+          throw error;
+        }
+        await axiosInstance.post('/conversations', {
+          user_id: userId,
+          id: conversation.id,
+          title: conversation.title,
+          messages: conversation.messages.map(toStoredMessage)
+        });
+      }
+    }).catch(error => {
+      console.error('Error syncing conversation:', error);
+    });
+    return pendingSync[conversation.id];
+  },
+
+  // Remove a conversation from backend storage
+  deleteConversation: async (conversationId) => {
+    try {
+      await axiosInstance.delete(`/conversations/${encodeURIComponent(conversationId)}`, {
+        params: { user_id: getUserId() }
+      });
+    } catch (error) {
+      if (error.response?.status !== 404) {
+        console.error('Error deleting conversation:', error);
+      }
+    } finally {
+      delete pendingSync[conversationId];
+    }
+  },
+
+  // Full-text search across this browser's stored conversations
+  searchConversations: async (query, page = 1, pageSize = 20) => {
+    try {
+      const response = await axiosInstance.get('/conversations/search', {
+        params: { q: query, user_id: getUserId(), page, page_size: pageSize }
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Error searching conversations:', error);
+      throw error;
+    }
   }
 };
@@ -73,7 +73,7 @@ fi
 
 # Start backend in background
 echo -e "${GREEN}[INFO]${NC} Starting backend on http://127.0.0.1:8001"
-uvicorn server:app --host 127.0.0.1 --port 8001 > /tmp/cyberai-backend.log 2>&1 &
+python serve.py --host 127.0.0.1 --port 8001 > /tmp/cyberai-backend.log 2>&1 &
 BACKEND_PID=$!
 echo -e "${GREEN}[OK]${NC} Backend PID: $BACKEND_PID"
 sleep 3
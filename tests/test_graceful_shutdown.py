@@ -0,0 +1,222 @@
+import asyncio
+import signal
+import socket
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from drain import DrainCoordinator, DrainMiddleware, DrainingServer
+
+
+def build_app(coordinator, events, release):
+    async def completions(request):
+        events.append("start completion")
+        await release.wait()
+        events.append("finish completion")
+        return JSONResponse({"response": "done"})
+
+    async def status(request):
+        return JSONResponse({"status": "ok"})
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await coordinator.shutdown(
+            flush=[lambda: events.append("flush")],
+            close=[lambda: events.append("close mongo")]
+        )
+
+    app = Starlette(
+        routes=[
+            Route("/api/chat/completions", completions, methods=["POST"]),
+            Route("/api/status", status),
+        ],
+        middleware=[Middleware(DrainMiddleware, coordinator=coordinator, path_prefixes=("/api/chat/",))],
+        lifespan=lifespan
+    )
+    return app
+
+
+async def start_server(app, coordinator):
+    """Serve the app on an ephemeral port; returns (server, task, base_url)."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    config = uvicorn.Config(app, lifespan="on", log_level="warning")
+    server = DrainingServer(config, coordinator) if coordinator else uvicorn.Server(config)
+    # The test sends the exit signal itself, as uvicorn's signal handler would
+    server.install_signal_handlers = lambda: None
+    task = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+async def wait_for(condition, timeout=5.0):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_exit_signal_drains_in_flight_requests_before_flushing_and_closing():
+    async def scenario():
+        coordinator = DrainCoordinator(grace_period=5)
+        events = []
+        release = asyncio.Event()
+        server, serving, base_url = await start_server(build_app(coordinator, events, release), coordinator)
+
+        async with httpx.AsyncClient(base_url=base_url) as in_flight_client, \
+                httpx.AsyncClient(base_url=base_url) as client:
+            in_flight = asyncio.create_task(in_flight_client.post("/api/chat/completions"))
+            await wait_for(lambda: coordinator.in_flight == 1)
+
+            server.handle_exit(signal.SIGTERM, None)
+
+            # The socket is still open: new chat requests get a 503, other routes still work
+            response = await client.post("/api/chat/completions")
+            assert response.status_code == 503
+            assert response.headers["retry-after"] == "5"
+            assert "shutting down" in response.json()["detail"]
+            assert (await client.get("/api/status")).status_code == 200
+            assert not server.should_exit
+            assert "flush" not in events
+
+            release.set()
+            response = await in_flight
+
+        await asyncio.wait_for(serving, 5)
+
+        assert response.status_code == 200
+        assert response.json() == {"response": "done"}
+        assert coordinator.in_flight == 0
+        assert events == ["start completion", "finish completion", "flush", "close mongo"]
+
+    asyncio.run(scenario())
+
+
+def test_exit_proceeds_after_grace_period_expires():
+    async def scenario():
+        coordinator = DrainCoordinator(grace_period=0.1)
+        events = []
+        server, serving, base_url = await start_server(build_app(coordinator, events, asyncio.Event()), coordinator)
+
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            stuck = asyncio.create_task(client.post("/api/chat/completions"))
+            await wait_for(lambda: coordinator.in_flight == 1)
+
+            server.handle_exit(signal.SIGTERM, None)
+
+            # uvicorn cancels the stuck request instead of waiting for it forever
+            await asyncio.wait_for(serving, 5)
+            response = await stuck
+
+        assert response.status_code == 500
+        assert server.config.timeout_graceful_shutdown == 1
+        assert events == ["start completion", "flush", "close mongo"]
+
+    asyncio.run(scenario())
+
+
+def test_plain_uvicorn_drains_from_lifespan_shutdown():
+    async def scenario():
+        coordinator = DrainCoordinator(grace_period=5)
+        events = []
+        release = asyncio.Event()
+        server, serving, base_url = await start_server(build_app(coordinator, events, release), None)
+
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            in_flight = asyncio.create_task(client.post("/api/chat/completions"))
+            await wait_for(lambda: coordinator.in_flight == 1)
+
+            server.handle_exit(signal.SIGTERM, None)
+            assert server.should_exit
+
+            await asyncio.sleep(0.3)
+            assert "flush" not in events
+            release.set()
+            response = await in_flight
+
+        await asyncio.wait_for(serving, 5)
+
+        assert response.status_code == 200
+        assert coordinator.drained
+        assert events == ["start completion", "finish completion", "flush", "close mongo"]
+
+    asyncio.run(scenario())
+
+
+def test_lifespan_shutdown_drains_when_no_exit_signal_did():
+    async def scenario():
+        coordinator = DrainCoordinator(grace_period=5)
+        events = []
+        release = asyncio.Event()
+
+        async def request():
+            async with coordinator.track():
+                await release.wait()
+                events.append("finish request")
+
+        in_flight = asyncio.create_task(request())
+        await asyncio.sleep(0)
+        shutdown = asyncio.create_task(coordinator.shutdown(flush=[lambda: events.append("flush")]))
+        await asyncio.sleep(0.05)
+
+        assert coordinator.draining
+        assert events == []
+
+        release.set()
+        await asyncio.gather(in_flight, shutdown)
+        assert events == ["finish request", "flush"]
+
+    asyncio.run(scenario())
+
+
+def test_server_app_drains_chat_completions(monkeypatch):
+    pytest.importorskip("emergentintegrations")
+    monkeypatch.setenv("MONGO_URL", "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=100")
+    monkeypatch.setenv("DB_NAME", "drain_test")
+
+    import server as backend
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_completion(**kwargs):
+            await release.wait()
+            return {"success": True, "message": "done", "provider": kwargs["provider"], "model": kwargs["model"]}
+
+        monkeypatch.setattr(backend.AIService, "chat_completion", staticmethod(slow_completion))
+        monkeypatch.setattr(backend.drain_coordinator, "grace_period", 5)
+        payload = {
+            "messages": [{"role": "user", "content": "what is xss"}],
+            "api_key": "sk-test",
+            "provider": "openai",
+            "model": "gpt-4o"
+        }
+        server, serving, base_url = await start_server(backend.app, backend.drain_coordinator)
+
+        async with httpx.AsyncClient(base_url=base_url) as in_flight_client, \
+                httpx.AsyncClient(base_url=base_url) as client:
+            in_flight = asyncio.create_task(in_flight_client.post("/api/chat/completions", json=payload))
+            await wait_for(lambda: backend.drain_coordinator.in_flight == 1)
+
+            server.handle_exit(signal.SIGTERM, None)
+
+            assert (await client.post("/api/chat/completions", json=payload)).status_code == 503
+
+            release.set()
+            response = await in_flight
+
+        await asyncio.wait_for(serving, 10)
+
+        assert response.status_code == 200
+        assert response.json()["message"] == "done"
+
+    asyncio.run(scenario())
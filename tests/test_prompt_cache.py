@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("emergentintegrations")
+pytest.importorskip("litellm")
+
+import ai_service
+from ai_service import AIService, CYBERSECURITY_SYSTEM_MESSAGE, build_prefix_cached_messages
+from semantic_cache import SemanticCache
+
+
+def breakpoints(prompt):
+    return [
+        i for i, turn in enumerate(prompt)
+        if isinstance(turn["content"], list) and "cache_control" in turn["content"][0]
+    ]
+
+
+def test_anthropic_marks_system_prompt_and_last_prior_turn():
+    prompt = build_prefix_cached_messages([
+        {"role": "user", "content": "what is xss", "timestamp": "2024-01-01T00:00:00"},
+        {"role": "assistant", "content": "Cross-site scripting is..."},
+        {"role": "user", "content": "how do I prevent it"},
+    ], "anthropic")
+
+    assert prompt[0]["content"][0]["text"] == CYBERSECURITY_SYSTEM_MESSAGE
+    assert breakpoints(prompt) == [0, 2]
+    assert prompt[-1] == {"role": "user", "content": "how do I prevent it"}
+    assert all("timestamp" not in turn for turn in prompt)
+
+
+def test_empty_prior_turn_is_not_marked():
+    prompt = build_prefix_cached_messages([
+        {"role": "user", "content": "what is xss"},
+        {"role": "assistant", "content": ""},
+        {"role": "user", "content": "again please"},
+    ], "anthropic")
+
+    assert breakpoints(prompt) == [0, 1]
+    assert prompt[2]["content"] == ""
+
+
+def test_other_providers_get_plain_stable_prefix():
+    first = build_prefix_cached_messages([{"role": "user", "content": "hi"}], "openai")
+    second = build_prefix_cached_messages([
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "hello"},
+        {"role": "user", "content": "what is csrf"},
+    ], "openai")
+
+    assert breakpoints(second) == []
+    assert second[:2] == first
+
+
+def test_empty_completion_is_a_failure_and_not_cached(monkeypatch):
+    async def acompletion(**kwargs):
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=None), finish_reason="content_filter")],
+            usage=None
+        )
+
+    monkeypatch.setattr(ai_service.litellm, "acompletion", acompletion)
+    cache = SemanticCache()
+
+    result = asyncio.run(AIService.chat_completion(
+        [{"role": "user", "content": "what is xss"}],
+        "sk-test", "openai", "gpt-4o", cache=cache, prompt_cache=True
+    ))
+
+    assert result["success"] is False
+    assert "content_filter" in result["error"]
+    assert cache.stats()["entries"] == 0
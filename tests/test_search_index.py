@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from search_index import ConversationSearchIndex, highlight, tokenize
+
+USER = "user-0123456789abcdef"
+
+
+def message(message_id, content, conversation_id="c1", user_id=USER):
+    return {
+        "id": message_id,
+        "conversation_id": conversation_id,
+        "user_id": user_id,
+        "role": "assistant",
+        "content": content
+    }
+
+
+def build_index(messages):
+    index = ConversationSearchIndex()
+    index.load(USER, messages)
+    return index
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    terms = tokenize("Patch CVE-2021-44228 in Log4j")
+
+    assert "cve-2021-44228" in terms
+    assert {"cve", "2021", "44228", "patch", "in", "log4j"} <= set(terms)
+
+
+def test_bm25_ranks_more_relevant_messages_first():
+    index = build_index([
+        message("m1", "nmap is a network scanner"),
+        message("m2", "log4j CVE-2021-44228 allows remote code execution via log4j lookups"),
+        message("m3", "a short note mentioning log4j once among many other unrelated words here"),
+    ])
+
+    total, hits = index.search(USER, "log4j", page=1, page_size=10)
+
+    assert total == 2
+    assert [m["id"] for _, m in hits] == ["m2", "m3"]
+    assert hits[0][0] > hits[1][0]
+
+
+def test_search_paginates_ranked_hits():
+    index = build_index([message(f"m{i}", "sql " * (i + 1) + "padding " * 5) for i in range(5)])
+
+    total, first = index.search(USER, "sql", page=1, page_size=2)
+    _, second = index.search(USER, "sql", page=2, page_size=2)
+    _, third = index.search(USER, "sql", page=3, page_size=2)
+
+    assert total == 5
+    ids = [m["id"] for _, m in first + second + third]
+    assert ids == ["m4", "m3", "m2", "m1", "m0"]
+    assert len(third) == 1
+
+
+def test_search_is_scoped_to_user():
+    index = build_index([message("m1", "xss payloads")])
+    index.load("other-user-0123456", [message("m2", "xss filters", user_id="other-user-0123456")])
+
+    _, hits = index.search(USER, "xss", page=1, page_size=10)
+
+    assert [m["id"] for _, m in hits] == ["m1"]
+    assert index.search("unloaded-user-012345", "xss", 1, 10) == (0, [])
+
+
+def test_added_messages_are_searchable_only_once_loaded():
+    index = ConversationSearchIndex()
+    index.add_message(message("m1", "burp suite intercept"))
+    assert not index.is_loaded(USER)
+
+    index.load(USER, [])
+    index.add_message(message("m2", "burp suite repeater"))
+    index.add_message(message("m2", "burp suite repeater"))
+
+    total, hits = index.search(USER, "burp", page=1, page_size=10)
+    assert total == 1
+    assert hits[0][1]["id"] == "m2"
+
+
+def test_remove_conversation_drops_its_messages():
+    index = build_index([
+        message("m1", "metasploit module", conversation_id="c1"),
+        message("m2", "metasploit payload", conversation_id="c2"),
+    ])
+
+    index.remove_conversation(USER, "c1")
+
+    total, hits = index.search(USER, "metasploit", page=1, page_size=10)
+    assert total == 1
+    assert hits[0][1]["id"] == "m2"
+    assert index.search(USER, "module", page=1, page_size=10) == (0, [])
+
+
+def test_least_recently_searched_user_is_evicted():
+    index = ConversationSearchIndex(max_users=2)
+    index.load("user-a-0123456789", [message("m1", "nmap", user_id="user-a-0123456789")])
+    index.load("user-b-0123456789", [message("m2", "nmap", user_id="user-b-0123456789")])
+    index.search("user-a-0123456789", "nmap", page=1, page_size=10)
+
+    index.load("user-c-0123456789", [])
+
+    assert index.is_loaded("user-a-0123456789")
+    assert not index.is_loaded("user-b-0123456789")
+    assert index.is_loaded("user-c-0123456789")
+
+
+def test_message_appended_during_load_is_indexed_once():
+    async def scenario():
+        index = ConversationSearchIndex()
+        stored = [message("m1", "sqlmap tamper scripts")]
+        fetched = asyncio.Event()
+        release = asyncio.Event()
+
+        async def fetch():
+            snapshot = list(stored)
+            fetched.set()
+            await release.wait()
+            return snapshot
+
+        loading = asyncio.create_task(index.ensure_loaded(USER, fetch))
+        await fetched.wait()
+        # Appended after the query read its rows, so the fetched list misses it
+        late = message("m2", "sqlmap risk levels")
+        stored.append(late)
+        index.add_message(late)
+        index.add_message(message("m1", "sqlmap tamper scripts"))
+        release.set()
+        await loading
+
+        total, hits = index.search(USER, "sqlmap", page=1, page_size=10)
+        assert total == 2
+        assert {m["id"] for _, m in hits} == {"m1", "m2"}
+
+    asyncio.run(scenario())
+
+
+def test_failed_load_leaves_user_unloaded():
+    async def scenario():
+        index = ConversationSearchIndex()
+
+        async def fetch():
+            raise RuntimeError("mongo unavailable")
+
+        with pytest.raises(RuntimeError):
+            await index.ensure_loaded(USER, fetch)
+        index.add_message(message("m1", "ignored"))
+
+        assert not index.is_loaded(USER)
+        assert index._loading == {}
+
+    asyncio.run(scenario())
+
+
+def test_highlight_escapes_html_and_marks_terms():
+    snippet = highlight('<script>alert("xss")</script> is a classic XSS probe', "xss")
+
+    assert "<script>" not in snippet
+    assert "&lt;script&gt;" in snippet
+    assert snippet.count("<mark>") == 2
+    assert "<mark>XSS</mark>" in snippet
+
+
+def test_highlight_trims_long_text_around_first_match():
+    text = "a" * 300 + " nmap " + "b" * 300
+
+    snippet = highlight(text, "nmap", context=20)
+
+    assert snippet.startswith("...") and snippet.endswith("...")
+    assert "<mark>nmap</mark>" in snippet
+    assert len(snippet) < 80
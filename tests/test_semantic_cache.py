@@ -0,0 +1,101 @@
+from semantic_cache import SemanticCache, embed_text
+
+KEY = "key-a"
+
+NEAR_MISSES = [
+    (
+        "Give me a step by step guide to exploit union based SQL injection in a MySQL login form",
+        "Give me a step by step guide to prevent union based SQL injection in a MySQL login form",
+    ),
+    (
+        "How do I scan all TCP ports on 10.0.0.5 with service version detection and OS fingerprinting",
+        "How do I scan all UDP ports on 10.0.0.5 with service version detection and OS fingerprinting",
+    ),
+    (
+        "Explain CVE-2021-44228 impact, affected log4j versions and how to detect exploitation attempts",
+        "Explain CVE-2021-45046 impact, affected log4j versions and how to detect exploitation attempts",
+    ),
+    ("How does XSS work?", "Why does XSS work?"),
+    ("How do I exploit SQL injection", "Why can I exploit SQL injection"),
+]
+
+
+def test_rephrased_prompt_hits():
+    cache = SemanticCache()
+    cache.store("What is XSS?", KEY, "openai", "gpt-4o", "XSS answer")
+
+    assert cache.lookup("explain xss", KEY, "openai", "gpt-4o") == "XSS answer"
+    assert cache.stats()["hits"] == 1
+
+
+def test_near_miss_prompts_do_not_hit():
+    for cached_prompt, query in NEAR_MISSES:
+        # Even a permissive threshold, which every pair passes by cosine, does not match them
+        assert float(embed_text(cached_prompt) @ embed_text(query)) >= 0.5
+
+        cache = SemanticCache(threshold=0.5)
+        cache.store(cached_prompt, KEY, "openai", "gpt-4o", "cached answer")
+        assert cache.lookup(query, KEY, "openai", "gpt-4o") is None
+
+
+def test_threshold_controls_spelling_variants():
+    cached_prompt = "How do I prevent SQL injection in login forms"
+    query = "How do I prevent SQL injections in login forms"
+
+    strict = SemanticCache(threshold=0.9)
+    strict.store(cached_prompt, KEY, "openai", "gpt-4o", "answer")
+    assert strict.lookup(query, KEY, "openai", "gpt-4o") is None
+
+    lenient = SemanticCache(threshold=0.8)
+    lenient.store(cached_prompt, KEY, "openai", "gpt-4o", "answer")
+    assert lenient.lookup(query, KEY, "openai", "gpt-4o") == "answer"
+
+
+def test_matching_entry_is_found_behind_closer_candidates():
+    query = "nmap fast scan of tcp ports on a host"
+    reordered = "host ports tcp scan fast nmap"
+    decoys = [f"{query} {word}" for word in ("now", "today", "quickly", "again", "twice")]
+    query_vector = embed_text(query)
+    assert all(
+        float(embed_text(d) @ query_vector) > float(embed_text(reordered) @ query_vector)
+        for d in decoys
+    )
+
+    cache = SemanticCache(threshold=0.8)
+    for decoy in decoys:
+        cache.store(decoy, KEY, "openai", "gpt-4o", decoy)
+    cache.store(reordered, KEY, "openai", "gpt-4o", "same question")
+
+    assert cache.lookup(query, KEY, "openai", "gpt-4o") == "same question"
+
+
+def test_entries_are_partitioned_by_key_and_model():
+    cache = SemanticCache()
+    cache.store("What is XSS?", KEY, "openai", "gpt-4o", "XSS answer")
+
+    assert cache.lookup("What is XSS?", "key-b", "openai", "gpt-4o") is None
+    assert cache.lookup("What is XSS?", KEY, "openai", "gpt-4o-mini") is None
+    assert cache.lookup("What is XSS?", KEY, "openai", "gpt-4o") == "XSS answer"
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(max_entries=2)
+    cache.store("what is xss", KEY, "openai", "gpt-4o", "xss")
+    cache.store("what is csrf", KEY, "openai", "gpt-4o", "csrf")
+    assert cache.lookup("what is xss", KEY, "openai", "gpt-4o") == "xss"
+
+    cache.store("what is ssrf", KEY, "openai", "gpt-4o", "ssrf")
+
+    assert cache.lookup("what is csrf", KEY, "openai", "gpt-4o") is None
+    assert cache.lookup("what is xss", KEY, "openai", "gpt-4o") == "xss"
+    assert cache.lookup("what is ssrf", KEY, "openai", "gpt-4o") == "ssrf"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_partition_grows_past_initial_slots():
+    cache = SemanticCache(max_entries=40)
+    for i in range(40):
+        cache.store(f"port {i} service", KEY, "openai", "gpt-4o", str(i))
+
+    assert cache.stats()["entries"] == 40
+    assert cache.lookup("port 3 service", KEY, "openai", "gpt-4o") == "3"
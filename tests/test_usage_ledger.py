@@ -0,0 +1,200 @@
+import asyncio
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from usage_ledger import UsageLedger, api_key_fingerprint
+
+
+class FakeRecords:
+    """usage_records stand-in with Mongo's unordered insert_many semantics."""
+
+    def __init__(self):
+        self.docs = {}
+        self.fail_after = None
+
+    async def insert_many(self, docs, ordered):
+        errors = []
+        for index, doc in enumerate(docs):
+            if self.fail_after is not None and index >= self.fail_after:
+                errors.append({"index": index, "code": 91, "errmsg": "shutdown in progress"})
+            elif doc["_id"] in self.docs:
+                errors.append({"index": index, "code": 11000, "errmsg": "duplicate key"})
+            else:
+                self.docs[doc["_id"]] = doc
+        self.fail_after = None
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": []})
+
+
+class FakeRollups:
+    """usage_rollups stand-in honouring the $ne batch guard and the unique rollup key."""
+
+    def __init__(self):
+        self.docs = {}
+        self.fail_next = False
+
+    async def bulk_write(self, ops, ordered):
+        if self.fail_next:
+            self.fail_next = False
+            raise PyMongoError("connection reset")
+        errors = []
+        for index, op in enumerate(ops):
+            query, update = op._filter, op._doc
+            key = (query["key_id"], query["provider"], query["model"], query["minute"])
+            doc = self.docs.get(key)
+            if doc is not None and query["batches"]["$ne"] in doc["batches"]:
+                if op._upsert:
+                    errors.append({"index": index, "code": 11000, "errmsg": "duplicate key"})
+                continue
+            if doc is None:
+                doc = self.docs[key] = {"batches": [], "latency_ms_max": 0}
+            for field, amount in update["$inc"].items():
+                doc[field] = doc.get(field, 0) + amount
+            doc["latency_ms_max"] = max(doc["latency_ms_max"], update["$max"]["latency_ms_max"])
+            doc["batches"].append(update["$push"]["batches"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": []})
+
+
+class FakeDb:
+    def __init__(self):
+        self.usage_records = FakeRecords()
+        self.usage_rollups = FakeRollups()
+
+
+def make_ledger(**kwargs):
+    db = FakeDb()
+    return db, UsageLedger(db, **kwargs)
+
+
+def only_rollup(db):
+    assert len(db.usage_rollups.docs) == 1
+    return next(iter(db.usage_rollups.docs.values()))
+
+
+def test_rollup_updates_aggregate_per_key_model_and_minute():
+    minute = datetime(2024, 5, 1, 12, 30)
+    base = {
+        "key_id": "k1", "provider": "openai", "model": "gpt-4o", "cached": False,
+        "usage_reported": True, "prompt_tokens": 10, "completion_tokens": 5, "cached_tokens": 2
+    }
+    batch = [
+        dict(base, timestamp=minute.replace(second=5), latency_ms=100.0, success=True),
+        dict(base, timestamp=minute.replace(second=50), latency_ms=300.0, success=False),
+        dict(base, timestamp=minute.replace(minute=31), latency_ms=50.0, success=True, model="gpt-4o-mini"),
+    ]
+
+    updates = UsageLedger._rollup_updates("batch-1", batch)
+
+    assert len(updates) == 2
+    query, update = next(u for u in updates if u[0]["model"] == "gpt-4o")
+    assert query["minute"] == minute
+    assert query["batches"] == {"$ne": "batch-1"}
+    assert update["$inc"] == {
+        "requests": 2, "successes": 1, "cache_hits": 0, "usage_reported": 2,
+        "prompt_tokens": 20, "completion_tokens": 10, "cached_tokens": 4, "latency_ms_total": 400.0
+    }
+    assert update["$max"] == {"latency_ms_max": 300.0}
+    assert update["$push"] == {"batches": "batch-1"}
+
+
+def test_record_stores_fingerprint_not_key():
+    _, ledger = make_ledger()
+    ledger.record("sk-secret", "openai", "gpt-4o", 12.0, True)
+
+    record = ledger._buffer[0]
+    assert record["key_id"] == api_key_fingerprint("sk-secret")
+    assert "sk-secret" not in record.values()
+    assert record["usage_reported"] is False
+
+
+def test_rollup_failure_after_insert_is_retried_without_double_counting():
+    async def scenario():
+        db, ledger = make_ledger(batch_size=10)
+        for _ in range(3):
+            ledger.record("sk-a", "openai", "gpt-4o", 10.0, True, {"prompt_tokens": 7})
+
+        db.usage_rollups.fail_next = True
+        assert await ledger.flush() is False
+        assert len(db.usage_records.docs) == 3
+        assert ledger.stats()["pending"] == 3
+
+        assert await ledger.flush() is True
+        assert len(db.usage_records.docs) == 3
+        rollup = only_rollup(db)
+        assert rollup["requests"] == 3
+        assert rollup["prompt_tokens"] == 21
+
+    asyncio.run(scenario())
+
+
+def test_partial_insert_failure_is_retried_without_duplicates():
+    async def scenario():
+        db, ledger = make_ledger(batch_size=10)
+        for _ in range(4):
+            ledger.record("sk-a", "openai", "gpt-4o", 10.0, True)
+
+        db.usage_records.fail_after = 2
+        assert await ledger.flush() is False
+        assert len(db.usage_records.docs) == 2
+        assert db.usage_rollups.docs == {}
+
+        assert await ledger.flush() is True
+        assert len(db.usage_records.docs) == 4
+        assert only_rollup(db)["requests"] == 4
+
+    asyncio.run(scenario())
+
+
+def test_replayed_batch_does_not_increment_rollups_again():
+    async def scenario():
+        db, ledger = make_ledger(batch_size=10)
+        ledger.record("sk-a", "openai", "gpt-4o", 10.0, True)
+        records = list(ledger._buffer)
+
+        await ledger._apply_rollups("batch-1", records)
+        await ledger._apply_rollups("batch-1", records)
+        await ledger._apply_rollups("batch-2", records)
+
+        assert only_rollup(db)["requests"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_full_buffer_drops_oldest_and_counts_it(caplog):
+    async def scenario():
+        db, ledger = make_ledger(max_buffer=3, batch_size=2)
+        for i in range(5):
+            ledger.record("sk-a", "openai", "gpt-4o", float(i), True)
+
+        assert ledger.stats()["dropped"] == 2
+        assert [r["latency_ms"] for r in ledger._buffer] == [2.0, 3.0, 4.0]
+        warnings = [r for r in caplog.records if "dropped" in r.getMessage()]
+        assert len(warnings) == 1
+
+        # A failed batch is held aside, so new records never push it out
+        db.usage_rollups.fail_next = True
+        assert await ledger.flush() is False
+        for i in range(5, 8):
+            ledger.record("sk-a", "openai", "gpt-4o", float(i), True)
+        assert ledger.stats() == {"buffered": 3, "pending": 2, "capacity": 3, "dropped": 3}
+
+    asyncio.run(scenario())
+
+
+def test_stop_drains_pending_and_buffered_records():
+    async def scenario():
+        db, ledger = make_ledger(batch_size=2, flush_interval=60)
+        ledger.start()
+        for _ in range(5):
+            ledger.record("sk-a", "openai", "gpt-4o", 10.0, True)
+
+        await ledger.stop()
+
+        assert len(db.usage_records.docs) == 5
+        assert only_rollup(db)["requests"] == 5
+        assert ledger.stats()["buffered"] == 0
+        assert ledger.stats()["pending"] == 0
+
+    asyncio.run(scenario())